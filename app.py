@@ -1,14 +1,92 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify
 from flask_socketio import SocketIO, emit
+import atexit
+import hashlib
 import os
+import queue
+import threading
+import time
 
 app = Flask(__name__)
 socketio = SocketIO(app)
 
-# Route principale che mostra un form HTML
-@app.route("/", methods=["GET"])
-def index():
-    return render_template_string("""
+# Finestra per raccogliere un blocco dopo il primo elemento e segnale di fine
+# per il writer
+BATCH_WINDOW = 0.01
+STOP = object()
+
+def take_batch(q, first, limit, window=BATCH_WINDOW):
+    """
+    Ritorna first più gli elementi arrivati entro window secondi, fino a limit
+    in tutto. Si ferma subito se incontra STOP.
+    """
+    items = [first]
+    deadline = time.monotonic() + window
+    while len(items) < limit and items[-1] is not STOP:
+        remaining = deadline - time.monotonic()
+        try:
+            items.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+# Scritture su data.txt raccolte in coda e scritte a blocchi da un thread,
+# con una sola write() per blocco invece di open/write/close per richiesta
+WRITE_BATCH_SIZE = 1024
+write_queue = queue.Queue()
+write_error = None
+data_fd = os.open("data.txt", os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+def write_lines(lines):
+    """Scrive le righe in un colpo solo in fondo a data.txt."""
+    global write_error
+    data = ("\n".join(lines) + "\n").encode()
+    try:
+        while data:
+            data = data[os.write(data_fd, data):]
+        write_error = None
+    except OSError as e:
+        # Il thread deve sopravvivere: l'errore viene esposto da /write finché
+        # una scrittura successiva non riesce
+        write_error = e
+        app.logger.error("Scrittura su data.txt fallita: %s", e)
+
+def writer():
+    while True:
+        # Attesa bloccante sul primo elemento: nessun risveglio a server inattivo
+        batch = take_batch(write_queue, write_queue.get(), WRITE_BATCH_SIZE)
+        lines = [line for line in batch if line is not STOP]
+        if lines:
+            write_lines(lines)
+        if len(lines) < len(batch):
+            return
+
+writer_thread = threading.Thread(target=writer, daemon=True)
+writer_thread.start()
+
+@atexit.register
+def drain_writes():
+    # Il writer scrive tutto ciò che precede STOP, in ordine, poi termina
+    write_queue.put(STOP)
+    writer_thread.join()
+
+# Messaggi WebSocket raccolti in coda e inviati a blocchi come "message_batch":
+# un solo frame per client con i messaggi arrivati entro BATCH_WINDOW
+EMIT_BATCH_SIZE = 1024
+emit_queue = queue.Queue()
+
+def emitter():
+    while True:
+        messages = take_batch(emit_queue, emit_queue.get(), EMIT_BATCH_SIZE)
+        try:
+            socketio.emit("message_batch", messages)
+        except Exception as e:
+            app.logger.error("Invio dei messaggi WebSocket fallito: %s", e)
+
+socketio.start_background_task(emitter)
+
+# Pagina principale statica: preparata una volta sola all'avvio
+INDEX_HTML = """
         <h2>Flask App with SocketIO and File Writing</h2>
         <form action="/write" method="post">
             <input type="text" name="content" placeholder="Write something..."/>
@@ -20,17 +98,34 @@ def index():
             socket.on('message', function(msg) {
                 alert('Received a message: ' + msg);
             });
+            socket.on('message_batch', function(msgs) {
+                msgs.forEach(function(msg) {
+                    alert('Received a message: ' + msg);
+                });
+            });
         </script>
-    """)
+    """
+INDEX_ETAG = hashlib.sha1(INDEX_HTML.encode()).hexdigest()
+
+# Route principale che mostra un form HTML
+@app.route("/", methods=["GET"])
+def index():
+    response = Response(INDEX_HTML, mimetype="text/html")
+    response.set_etag(INDEX_ETAG)
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    return response.make_conditional(request)
 
 # Route per scrivere su file
 @app.route("/write", methods=["POST"])
 def write_file():
     content = request.form.get("content", "")
-    with open("data.txt", "a") as f:
-        f.write(content + "\n")
-    # Emit event to WebSocket clients
-    socketio.emit("message", f"New content added: {content}")
+    # Si accoda comunque: il writer riprova e, se ci riesce, azzera l'errore
+    write_queue.put(content)
+    if write_error is not None:
+        return "Write failed", 500
+    # Emit event to WebSocket clients (sent in batches by emitter)
+    emit_queue.put(f"New content added: {content}")
     return f"Content saved: {content}"
 
 # Semplice evento WebSocket
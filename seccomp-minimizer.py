@@ -10,17 +10,63 @@ assicurandosi che il container possa comunque:
 4. Gestire invii di form e scrittura di file
 """
 
-import json
+import hashlib
 import subprocess
 import time
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 import sys
 import os
-from typing import List, Dict, Any
+import queue
+import re
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AbstractSet, List, Dict, Any, Set, FrozenSet, Optional, Tuple
 
 # Flag verboso per output dettagliato
 VERBOSE = True
 
+# Immagine dell'applicazione da testare
+IMAGE = "flask:0.0.3"
+
+# Numero di container di test in parallelo, ognuno sulla propria porta host
+MAX_WORKERS = 8
+BASE_PORT = 5000
+
+# Pool delle porte host libere e lock per la cache dei risultati
+PORT_POOL: "queue.Queue[int]" = queue.Queue()
+for _port in range(BASE_PORT, BASE_PORT + MAX_WORKERS):
+    PORT_POOL.put(_port)
+CACHE_LOCK = threading.Lock()
+
+# Risultato dell'ultima minimizzazione, riusato se nulla è cambiato
+RUN_CACHE_PATH = ".seccomp_cache.json"
+
+# Record di audit generati da SCMP_ACT_LOG (code=0x7ffc0000), sia dal
+# trasporto kernel ("type=1326") sia da quello audit di journald ("SECCOMP"),
+# con il pid del processo (nel namespace dell'host) e il numero della syscall
+AUDIT_SECCOMP_RE = re.compile(
+    r"(?:type=1326|SECCOMP) .*?\bpid=(\d+)\b.*?\bsyscall=(\d+)\b.*?\bcode=0x7ffc0000"
+)
+
+# Cartella dei profili di test: tmpfs se disponibile, così non toccano il disco
+PROFILE_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# Tempo massimo di attesa perché l'applicazione risponda dopo l'avvio
+READY_TIMEOUT = 5.0
+
+# File scritto dall'app nel container e tempo massimo perché la scrittura avvenga
+DATA_FILE = "/app/data.txt"
+WRITE_TIMEOUT = 1.0
+
+# Sessione HTTP condivisa con keep-alive: un pool di connessioni per porta,
+# e ogni porta è usata da un solo thread alla volta
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=1))
+
 def log(message: str):
     """Stampa messaggi informativi se il verbose è attivo."""
     if VERBOSE:
@@ -41,21 +87,13 @@ def stop_all_containers():
             container_ids = result.stdout.strip().split('\n')
             log(f"Trovati {len(container_ids)} container in esecuzione")
             
-            # Ferma tutti i container
+            # Ferma e rimuove tutti i container con un solo comando
             subprocess.run(
-                ["docker", "stop"] + container_ids,
+                ["docker", "rm", "-f"] + container_ids,
                 check=True,
                 capture_output=True
             )
-            log("Tutti i container fermati con successo")
-            
-            # Rimuovi tutti i container
-            subprocess.run(
-                ["docker", "rm"] + container_ids,
-                check=True,
-                capture_output=True
-            )
-            log("Tutti i container rimossi con successo")
+            log("Tutti i container fermati e rimossi con successo")
         else:
             log("Nessun container in esecuzione trovato")
     except subprocess.CalledProcessError as e:
@@ -64,37 +102,116 @@ def stop_all_containers():
 def load_seccomp_profile(filepath: str) -> Dict[str, Any]:
     """Carica il profilo seccomp da un file JSON."""
     log(f"Caricamento del profilo seccomp da {filepath}")
-    with open(filepath, 'r') as f:
-        return json.load(f)
+    with open(filepath, 'rb') as f:
+        return orjson.loads(f.read())
 
-def save_seccomp_profile(profile: Dict[str, Any], filepath: str):
-    """Salva il profilo seccomp in un file JSON."""
+def write_file(filepath: str, data: bytes):
+    """Scrive data nel file con una sola write(2), senza il buffer di Python."""
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+def save_seccomp_profile(profile: Dict[str, Any], filepath: str, indent: bool = True):
+    """
+    Salva il profilo seccomp in un file JSON.
+    I profili di test, letti solo da Docker, si possono salvare senza indentazione.
+    """
     log(f"Salvataggio del profilo seccomp in {filepath}")
-    with open(filepath, 'w') as f:
-        json.dump(profile, f, indent=2)
+    write_file(filepath, orjson.dumps(profile, option=orjson.OPT_INDENT_2 if indent else 0))
 
-def get_all_syscalls(profile: Dict[str, Any]) -> List[str]:
-    """Estrae tutti i nomi delle system call dal profilo seccomp."""
-    syscalls = []
-    for syscall_group in profile.get('syscalls', []):
-        syscalls.extend(syscall_group.get('names', []))
-    return sorted(list(set(syscalls)))
+def build_syscall_index(profile: Dict[str, Any]) -> Dict[str, List[int]]:
+    """Mappa ogni system call agli indici dei gruppi del profilo che la contengono."""
+    index = defaultdict(list)
+    for i, syscall_group in enumerate(profile.get('syscalls', [])):
+        for name in syscall_group.get('names', ()):
+            index[name].append(i)
+    return dict(index)
 
-def remove_syscall_from_profile(profile: Dict[str, Any], syscall_name: str) -> Dict[str, Any]:
-    """Crea un nuovo profilo rimuovendo la system call specificata."""
-    new_profile = json.loads(json.dumps(profile))  # Deep copy
-    
-    # Rimuove la syscall da tutti i gruppi
-    for syscall_group in new_profile.get('syscalls', []):
-        if 'names' in syscall_group and syscall_name in syscall_group['names']:
-            syscall_group['names'].remove(syscall_name)
+def remove_syscalls_from_profile(
+    profile: Dict[str, Any],
+    syscall_names: AbstractSet[str],
+    index: Dict[str, List[int]],
+) -> Dict[str, Any]:
+    """
+    Crea un nuovo profilo rimuovendo tutte le system call specificate.
+    Copia solo i gruppi modificati: il resto è condiviso con il profilo originale,
+    che quindi non va modificato sul posto. Con l'indice di build_syscall_index
+    i gruppi da modificare si trovano senza scorrere tutti i gruppi.
+    """
+    # Ogni gruppo toccato viene ricostruito una volta sola, con un test di
+    # appartenenza O(1) sul set delle syscall da rimuovere: le altre liste di
+    # nomi restano condivise e non vengono né scorse né copiate
+    touched = {i for name in syscall_names for i in index.get(name, ())}
+    syscalls = list(profile.get('syscalls', []))
+    for i in touched:
+        syscalls[i] = {**syscalls[i], 'names': [
+            name for name in syscalls[i]['names'] if name not in syscall_names
+        ]}
     
+    new_profile = dict(profile)
+    new_profile['syscalls'] = syscalls
     return new_profile
 
-def run_container_with_profile(profile_path: str, timeout: int = 30) -> bool:
+def watch_container_exit(container_id: str, since: float) -> Tuple[subprocess.Popen, threading.Event]:
+    """
+    Segue gli eventi Docker del container. Ritorna il processo `docker events`
+    (da terminare a fine attesa) e un Event impostato appena il container termina.
+    Con since non si perde un'uscita avvenuta prima dell'ascolto.
+    """
+    died = threading.Event()
+    events = subprocess.Popen(
+        ["docker", "events", "--since", f"{since:.3f}",
+         "--filter", f"container={container_id}", "--filter", "event=die",
+         "--format", "{{.Action}}"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True
+    )
+    
+    def wait_for_die():
+        if events.stdout.readline():
+            died.set()
+    
+    threading.Thread(target=wait_for_die, daemon=True).start()
+    return events, died
+
+def wait_until_ready(
+    port: int,
+    timeout: float = READY_TIMEOUT,
+    died: Optional[threading.Event] = None,
+) -> bool:
+    """
+    Interroga la pagina principale finché non risponde 200 o scade il timeout.
+    Sostituisce sia l'attesa fissa sia il primo test della pagina principale.
+    Si ferma subito se died viene impostato, cioè se il container è terminato.
+    """
+    url = f"http://localhost:{port}/"
+    deadline = time.monotonic() + timeout
+    
+    while time.monotonic() < deadline:
+        if died is not None and died.is_set():
+            log("Il container è terminato durante l'avvio")
+            return False
+        try:
+            response = SESSION.get(url, timeout=0.2)
+            if response.status_code == 200:
+                log("Pagina principale caricata con successo")
+                return True
+            log(f"Pagina principale fallita con status {response.status_code}")
+            return False
+        except requests.exceptions.RequestException:
+            time.sleep(0.05)
+    
+    log(f"Il container non ha risposto entro {timeout} secondi")
+    return False
+
+def run_container_with_profile(profile_path: str, port: int, timeout: int = 30) -> Optional[str]:
     """
-    Esegue il container con il profilo seccomp specificato.
-    Ritorna True se ha successo, False altrimenti.
+    Esegue il container con il profilo seccomp specificato, esposto sulla porta data.
+    Ritorna l'ID del container se ha successo, None altrimenti.
     """
     log(f"Test del container con profilo: {profile_path}")
     
@@ -104,11 +221,12 @@ def run_container_with_profile(profile_path: str, timeout: int = 30) -> bool:
             "docker", "run", "-d", "--rm",
             f"--security-opt=seccomp={profile_path}",
             "--security-opt=apparmor=apparmor-flask",
-            "-p", "5000:5000",
-            "flask:0.0.3"
+            "-p", f"{port}:5000",
+            IMAGE
         ]
         
         log(f"Esecuzione comando: {' '.join(cmd)}")
+        since = time.time()
         result = subprocess.run(
             cmd,
             capture_output=True,
@@ -118,68 +236,85 @@ def run_container_with_profile(profile_path: str, timeout: int = 30) -> bool:
         
         if result.returncode != 0:
             log(f"Avvio del container fallito: {result.stderr}")
-            return False
+            return None
             
         container_id = result.stdout.strip()
         log(f"Container avviato con ID: {container_id}")
         
-        # Attendi un po’ per l’inizializzazione
-        time.sleep(5)
+        # Attendi che l'applicazione risponda, fermandoti subito se il container muore
+        events, died = watch_container_exit(container_id, since)
+        try:
+            ready = wait_until_ready(port, died=died)
+        finally:
+            events.kill()
+            events.wait()
         
-        # Verifica se il container è ancora in esecuzione
-        inspect_result = subprocess.run(
-            ["docker", "inspect", container_id],
-            capture_output=True,
-            text=True
-        )
+        if ready:
+            log("Il container è in esecuzione e risponde")
+            return container_id
         
-        if inspect_result.returncode != 0:
-            log("Impossibile ispezionare il container")
-            return False
-            
-        container_info = json.loads(inspect_result.stdout)
-        if not container_info[0]['State']['Running']:
+        if died.is_set():
             log("Il container non è in esecuzione")
-            # Mostra i log per capire cosa è andato storto
-            logs_result = subprocess.run(
-                ["docker", "logs", container_id],
-                capture_output=True,
-                text=True
-            )
-            if logs_result.returncode == 0:
-                log(f"Log del container: {logs_result.stdout}")
-            return False
-            
-        log("Il container è in esecuzione")
-        return True
+            # Mostra i log per capire cosa è andato storto (solo se verranno stampati)
+            if VERBOSE:
+                logs_result = subprocess.run(
+                    ["docker", "logs", container_id],
+                    capture_output=True,
+                    text=True
+                )
+                if logs_result.returncode == 0:
+                    log(f"Log del container: {logs_result.stdout}")
+            return None
+        
+        log("Il container è in esecuzione ma non risponde")
+        stop_container(container_id)
+        return None
         
     except subprocess.TimeoutExpired:
         log("Timeout durante l’avvio del container")
-        return False
+        return None
     except Exception as e:
         log(f"Errore nell’esecuzione del container: {e}")
-        return False
+        return None
 
-def test_web_functionality() -> bool:
+def wait_for_file_content(
+    container_id: str,
+    content: bytes,
+    timeout: float = WRITE_TIMEOUT,
+) -> bool:
+    """
+    Controlla che content sia arrivato in DATA_FILE dentro il container.
+    L'app scrive su file in un thread separato, quindi si riprova fino al timeout.
+    Il file è letto con `docker cp`, eseguito dal demone e non nel container,
+    così il controllo non dipende dal profilo seccomp in prova.
     """
-    Verifica se l’applicazione web funziona correttamente.
+    deadline = time.monotonic() + timeout
+    
+    while time.monotonic() < deadline:
+        result = subprocess.run(
+            ["docker", "cp", f"{container_id}:{DATA_FILE}", "-"],
+            capture_output=True
+        )
+        if result.returncode == 0 and content in result.stdout:
+            return True
+        time.sleep(0.05)
+    
+    return False
+
+def test_web_functionality(port: int, container_id: str) -> bool:
+    """
+    Verifica se l’applicazione web sulla porta data funziona correttamente,
+    compresa la scrittura effettiva su file nel container.
     Ritorna True se tutti i test passano, False altrimenti.
     """
-    log("Test della funzionalità web...")
+    log(f"Test della funzionalità web sulla porta {port}...")
+    base_url = f"http://localhost:{port}"
     
     try:
-        # Test 1: Caricamento pagina principale
-        log("Test accesso alla pagina principale...")
-        response = requests.get("http://localhost:5000/", timeout=10)
-        if response.status_code != 200:
-            log(f"Pagina principale fallita con status {response.status_code}")
-            return False
-        log("Pagina principale caricata con successo")
-        
-        # Test 2: Invio form
+        # Invio form (la pagina principale è già verificata da wait_until_ready)
         log("Test invio form...")
-        response = requests.post(
-            "http://localhost:5000/write",
+        response = SESSION.post(
+            f"{base_url}/write",
             data={"content": "test_content"},
             timeout=10
         )
@@ -188,6 +323,12 @@ def test_web_functionality() -> bool:
             return False
         log("Invio form riuscito")
         
+        # La risposta arriva prima della scrittura: verifica che sia avvenuta
+        if not wait_for_file_content(container_id, b"test_content\n"):
+            log(f"Il contenuto inviato non è stato scritto in {DATA_FILE}")
+            return False
+        log("Scrittura su file riuscita")
+        
         return True
         
     except requests.exceptions.RequestException as e:
@@ -197,93 +338,424 @@ def test_web_functionality() -> bool:
         log(f"Errore inaspettato durante test web: {e}")
         return False
 
-def stop_container():
-    """Ferma il container di test."""
+def stop_container(container_id: str):
+    """Ferma un singolo container di test, senza toccare quelli in parallelo."""
+    try:
+        subprocess.run(
+            ["docker", "stop", "-t", "0", container_id],
+            capture_output=True
+        )
+        log(f"Fermato container {container_id}")
+    except Exception as e:
+        log(f"Errore fermando il container {container_id}: {e}")
+
+def stop_test_containers():
+    """Ferma tutti i container di test avviati dall'immagine dell'app."""
     try:
-        # Trova e ferma il container
+        # Trova e ferma i container
         result = subprocess.run(
-            ["docker", "ps", "-q", "--filter", "ancestor=flask:0.0.3"],
+            ["docker", "ps", "-q", "--filter", f"ancestor={IMAGE}"],
             capture_output=True,
             text=True
         )
         
         if result.stdout.strip():
+            # Un solo comando per tutti i container (rimossi grazie a --rm)
             container_ids = result.stdout.strip().split('\n')
-            for container_id in container_ids:
-                subprocess.run(
-                    ["docker", "stop", container_id],
-                    capture_output=True
-                )
-                log(f"Fermato container {container_id}")
+            subprocess.run(
+                ["docker", "stop", "-t", "0"] + container_ids,
+                capture_output=True
+            )
+            log(f"Fermati {len(container_ids)} container di test")
     except Exception as e:
-        log(f"Errore fermando il container: {e}")
+        log(f"Errore fermando i container: {e}")
+
+def compute_run_key() -> Optional[str]:
+    """
+    Calcola la chiave del risultato: hash di app.py, del profilo di default e
+    dell'ID dell'immagine. Ritorna None se l'immagine non è ispezionabile.
+    """
+    result = subprocess.run(
+        ["docker", "image", "inspect", "--format", "{{.Id}}", IMAGE],
+        capture_output=True
+    )
+    if result.returncode != 0:
+        log(f"Impossibile ispezionare l'immagine {IMAGE}, cache disabilitata")
+        return None
+    
+    digest = hashlib.sha256(result.stdout.strip())
+    for path in ("app.py", "seccomp-default.json"):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def load_run_cache(key: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Carica il risultato di un'esecuzione precedente se la chiave corrisponde."""
+    if key is None:
+        return None
+    try:
+        with open(RUN_CACHE_PATH, 'rb') as f:
+            cached_run = orjson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    return cached_run if cached_run.get("key") == key else None
+
+def save_run_cache(key: Optional[str], necessary: Set[str], profile: Dict[str, Any]):
+    """Salva il risultato della minimizzazione per le esecuzioni successive."""
+    if key is None:
+        return
+    log(f"Salvataggio del risultato in {RUN_CACHE_PATH}")
+    write_file(RUN_CACHE_PATH, orjson.dumps({"key": key, "necessary": sorted(necessary), "profile": profile}))
+
+def test_profile(
+    base_profile: Dict[str, Any],
+    index: Dict[str, List[int]],
+    removed: FrozenSet[str],
+) -> bool:
+    """
+    Verifica il profilo ottenuto togliendo da base_profile tutte le syscall in removed.
+    Ritorna True se il container si avvia e l'applicazione web funziona.
+    Può essere chiamata da più thread: ognuno usa una porta libera del pool.
+
+    removed è l'unica differenza rispetto al profilo base, che resta in memoria:
+    il profilo completo viene materializzato solo qui, nel file letto da Docker.
+    """
+    port = PORT_POOL.get()
+    profile = remove_syscalls_from_profile(base_profile, removed, index)
+    test_profile_path = os.path.join(PROFILE_DIR, f"seccomp_test_{port}.json")
+    save_seccomp_profile(profile, test_profile_path, indent=False)
+    container_id = None
+    
+    try:
+        # Testa il profilo
+        container_id = run_container_with_profile(test_profile_path, port)
+        if container_id is None:
+            log("Il container non si avvia con questo profilo")
+            return False
+        
+        # Se il container parte, verifica la funzionalità web
+        if not test_web_functionality(port, container_id):
+            log("La funzionalità web non è garantita con questo profilo")
+            return False
+        
+        return True
+    except Exception as e:
+        log(f"Errore durante il test del profilo: {e}")
+        return False
+    finally:
+        # Ferma il proprio container, rimuovi file di test e libera la porta
+        if container_id is not None:
+            stop_container(container_id)
+        try:
+            os.remove(test_profile_path)
+        except:
+            pass
+        PORT_POOL.put(port)
+
+def make_trace_profile(
+    profile: Dict[str, Any],
+    traced: Optional[AbstractSet[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Crea un profilo identico a quello dato ma con SCMP_ACT_LOG al posto di
+    SCMP_ACT_ALLOW: le syscall restano permesse ma il kernel le registra.
+    Se traced è indicato solo quelle syscall passano a SCMP_ACT_LOG, le altre
+    restano SCMP_ACT_ALLOW e non riempiono il log.
+    """
+    syscalls = []
+    for syscall_group in profile.get('syscalls', []):
+        if syscall_group.get('action') != 'SCMP_ACT_ALLOW':
+            syscalls.append(syscall_group)
+            continue
+        
+        names = syscall_group.get('names', [])
+        logged = names if traced is None else [name for name in names if name in traced]
+        allowed = [] if traced is None else [name for name in names if name not in traced]
+        if allowed:
+            syscalls.append({**syscall_group, 'names': allowed})
+        if logged:
+            syscalls.append({**syscall_group, 'names': logged, 'action': 'SCMP_ACT_LOG'})
+    
+    trace_profile = dict(profile)
+    trace_profile['syscalls'] = syscalls
+    return trace_profile
+
+def load_syscall_table() -> Optional[Dict[int, str]]:
+    """Ritorna la tabella numero -> nome delle syscall dell'host tramite ausyscall."""
+    try:
+        result = subprocess.run(
+            ["ausyscall", "--dump"],
+            capture_output=True,
+            text=True
+        )
+    except FileNotFoundError:
+        log("ausyscall non trovato, impossibile tradurre i numeri delle syscall")
+        return None
+    
+    table = {}
+    for line in result.stdout.splitlines():
+        fields = line.split()
+        if len(fields) == 2 and fields[0].isdigit():
+            table[int(fields[0])] = fields[1]
+    return table or None
+
+def read_logged_syscalls(since: int, pid: int, table: Dict[int, str]) -> Set[str]:
+    """
+    Legge dal journal le syscall registrate da SCMP_ACT_LOG a partire da since,
+    considerando solo i record del processo pid (quello dell'app nel container).
+    """
+    # Più condizioni sullo stesso campo sono in OR: record dal kernel o da audit
+    result = subprocess.run(
+        ["journalctl", "_TRANSPORT=kernel", "_TRANSPORT=audit", "--boot",
+         "--since", f"@{since}", "-o", "cat"],
+        capture_output=True,
+        text=True
+    )
+    
+    logged = set()
+    for match in AUDIT_SECCOMP_RE.finditer(result.stdout):
+        if int(match.group(1)) != pid:
+            continue
+        name = table.get(int(match.group(2)))
+        if name is not None:
+            logged.add(name)
+    return logged
+
+def get_container_pid(container_id: str) -> Optional[int]:
+    """Ritorna il pid sull'host del processo principale del container."""
+    result = subprocess.run(
+        ["docker", "inspect", "-f", "{{.State.Pid}}", container_id],
+        capture_output=True,
+        text=True
+    )
+    pid = result.stdout.strip()
+    if result.returncode != 0 or not pid.isdigit() or int(pid) == 0:
+        log(f"Impossibile ottenere il pid del container {container_id}")
+        return None
+    return int(pid)
+
+def trace_syscalls(
+    base_profile: Dict[str, Any],
+    traced: Optional[AbstractSet[str]] = None,
+) -> Optional[Set[str]]:
+    """
+    Avvia un solo container con il profilo in modalità SCMP_ACT_LOG (solo per le
+    syscall in traced, se indicate), esegue i test web e ritorna le syscall
+    effettivamente usate secondo il log di audit.
+    Ritorna None se il tracciamento non è possibile o non registra nulla.
+    """
+    table = load_syscall_table()
+    if table is None:
+        return None
+    
+    port = PORT_POOL.get()
+    trace_profile_path = os.path.join(PROFILE_DIR, "seccomp_trace.json")
+    save_seccomp_profile(make_trace_profile(base_profile, traced), trace_profile_path, indent=False)
+    since = int(time.time())
+    container_id = None
+    
+    try:
+        container_id = run_container_with_profile(trace_profile_path, port)
+        if container_id is None or not test_web_functionality(port, container_id):
+            log("Il container non funziona con il profilo di tracciamento")
+            return None
+        
+        # Flask gira in un solo processo: il suo pid identifica i record del container
+        pid = get_container_pid(container_id)
+        if pid is None:
+            return None
+    finally:
+        if container_id is not None:
+            stop_container(container_id)
+        try:
+            os.remove(trace_profile_path)
+        except:
+            pass
+        PORT_POOL.put(port)
+    
+    logged = read_logged_syscalls(since, pid, table)
+    if not logged:
+        log("Nessuna syscall registrata: verifica che il journal sia leggibile")
+        return None
+    
+    log(f"Registrate {len(logged)} syscall usate dall'applicazione")
+    return logged
+
+def cached_test_profile(
+    base_profile: Dict[str, Any],
+    index: Dict[str, List[int]],
+    removed: FrozenSet[str],
+    cache: Dict[FrozenSet[str], bool],
+) -> bool:
+    """Come test_profile, ma riusa il risultato se lo stesso profilo è già stato testato."""
+    with CACHE_LOCK:
+        if removed in cache:
+            return cache[removed]
+    
+    result = test_profile(base_profile, index, removed)
+    with CACHE_LOCK:
+        cache[removed] = result
+    return result
+
+def split_candidates(candidates: List[str], parts: int) -> List[List[str]]:
+    """Divide le candidate in al più parts blocchi contigui di dimensione simile."""
+    size = -(-len(candidates) // parts)
+    return [candidates[i:i + size] for i in range(0, len(candidates), size)]
+
+def ddmin(
+    base_profile: Dict[str, Any],
+    index: Dict[str, List[int]],
+    candidates: List[str],
+    removed: Set[str],
+    necessary: Set[str],
+    cache: Dict[FrozenSet[str], bool],
+    executor: ThreadPoolExecutor,
+):
+    """
+    Bisezione (delta debugging) sulle syscall candidate.
+
+    Divide le candidate in blocchi (uno per worker) e prova in parallelo a
+    rimuovere ciascun blocco: i blocchi che funzionano vengono rimossi in modo
+    definitivo, gli altri vengono suddivisi ricorsivamente. Aggiorna removed e
+    necessary sul posto; viene chiamata solo dal thread principale.
+    """
+    if not candidates:
+        return
+    
+    parts = max(2, min(MAX_WORKERS, len(candidates))) if len(candidates) > 1 else 1
+    chunks = split_candidates(candidates, parts)
+    current = frozenset(removed)
+    
+    for chunk in chunks:
+        log(f"Test rimozione di {len(chunk)} syscall ({chunk[0]} .. {chunk[-1]})")
+    results = list(executor.map(
+        lambda chunk: cached_test_profile(base_profile, index, current | set(chunk), cache),
+        chunks,
+    ))
+    
+    passed = [chunk for chunk, ok in zip(chunks, results) if ok]
+    failed = [chunk for chunk, ok in zip(chunks, results) if not ok]
+    retest = []
+    pending = []
+    
+    # I blocchi rimovibili singolarmente potrebbero non esserlo insieme:
+    # se l'unione non funziona si accetta solo il primo e si riverificano gli altri
+    if len(passed) > 1:
+        union = current.union(*passed)
+        if not cached_test_profile(base_profile, index, union, cache):
+            retest = passed[1:]
+            passed = passed[:1]
+    
+    for chunk in passed:
+        log(f"Le syscall {', '.join(chunk)} NON sono necessarie - possono essere rimosse")
+        removed.update(chunk)
+    
+    # Ogni blocco da riverificare si riprova prima intero sulle rimozioni
+    # aggiornate: di solito basta un test, si suddivide solo se fallisce
+    for chunk in retest:
+        if cached_test_profile(base_profile, index, frozenset(removed) | set(chunk), cache):
+            log(f"Le syscall {', '.join(chunk)} NON sono necessarie - possono essere rimosse")
+            removed.update(chunk)
+        else:
+            pending.append(chunk)
+    
+    for chunk in failed:
+        if len(chunk) == 1:
+            log(f"La syscall {chunk[0]} è necessaria")
+            necessary.add(chunk[0])
+        else:
+            pending.append(chunk)
+    
+    for chunk in pending:
+        ddmin(base_profile, index, chunk, removed, necessary, cache, executor)
 
 def minimize_seccomp_profile():
     """Funzione principale per minimizzare il profilo seccomp."""
     log("Inizio minimizzazione del profilo seccomp...")
     
+    # Se app, immagine e profilo di default non sono cambiati riusa il risultato precedente
+    run_key = compute_run_key()
+    cached_run = load_run_cache(run_key)
+    if cached_run is not None:
+        log(f"Risultato già presente in {RUN_CACHE_PATH}, nessun container da testare")
+        save_seccomp_profile(cached_run["profile"], "seccomp.json")
+        save_seccomp_profile(cached_run["profile"], "seccomp-minimized.json")
+        log(f"Syscall necessarie ({len(cached_run['necessary'])}):")
+        for syscall in cached_run["necessary"]:
+            log(f"  - {syscall}")
+        log("Profilo minimizzato salvato come seccomp-minimized.json")
+        return
+    
     # Ferma tutti i container
     stop_all_containers()
     
     # Carica profilo di default (permissivo)
     default_profile = load_seccomp_profile("seccomp-default.json")
     
-    # Crea profilo iniziale di lavoro (copia del default)
-    working_profile = json.loads(json.dumps(default_profile))
+    # Il profilo di lavoro resta in memoria (il default non viene mai modificato
+    # sul posto) e seccomp.json viene scritto una volta sola alla fine
     working_profile_path = "seccomp.json"
-    save_seccomp_profile(working_profile, working_profile_path)
     
-    # Ottieni tutte le syscalls
-    all_syscalls = get_all_syscalls(working_profile)
+    # Indicizza una sola volta syscall -> gruppi, in ordine per nome
+    index = build_syscall_index(default_profile)
+    all_syscalls = sorted(index)
     log(f"Trovate {len(all_syscalls)} system call da testare")
     
-    # Lista delle syscalls necessarie
+    # Syscall rimovibili e necessarie, più la cache dei profili già testati
+    removed_syscalls = set()
     necessary_syscalls = set()
+    cache = {}
     
-    # Testa ogni syscall
-    for i, syscall in enumerate(all_syscalls):
-        log(f"Test syscall {i+1}/{len(all_syscalls)}: {syscall}")
-        
-        # Crea profilo senza questa syscall
-        test_profile = remove_syscall_from_profile(working_profile, syscall)
-        test_profile_path = f"seccomp_test_{syscall}.json"
-        save_seccomp_profile(test_profile, test_profile_path)
+    # Tracciamento con SCMP_ACT_LOG: un solo container indica le syscall usate
+    candidates = all_syscalls
+    observed = trace_syscalls(default_profile)
+    if observed is not None:
+        # Le syscall di gruppi non ALLOW (es. clone3 -> ENOSYS) non vengono
+        # registrate ma rimuoverle cambierebbe il comportamento: si tengono
+        kept = observed | {
+            name
+            for syscall_group in default_profile.get('syscalls', [])
+            if syscall_group.get('action') != 'SCMP_ACT_ALLOW'
+            for name in syscall_group.get('names', ())
+        }
+        necessary_syscalls.update(kept & set(all_syscalls))
+        candidates = [syscall for syscall in all_syscalls if syscall not in kept]
         
-        try:
-            # Ferma eventuale container
-            stop_container()
+        # Verifica in un colpo solo la rimozione di tutte le syscall non usate.
+        # Se non basta il log ha perso qualche record (es. per rate limit): si
+        # ritraccia registrando solo le candidate rimaste, che sono molte meno
+        while candidates:
+            log(f"Test rimozione delle {len(candidates)} syscall non registrate")
+            if cached_test_profile(default_profile, index, frozenset(candidates), cache):
+                removed_syscalls.update(candidates)
+                candidates = []
+                break
             
-            # Testa il profilo
-            if run_container_with_profile(test_profile_path):
-                # Se il container parte, verifica la funzionalità web
-                if test_web_functionality():
-                    log(f"La syscall {syscall} NON è necessaria - può essere rimossa")
-                    # Aggiorna profilo di lavoro
-                    working_profile = test_profile
-                    save_seccomp_profile(working_profile, working_profile_path)
-                else:
-                    log(f"La syscall {syscall} è necessaria per la funzionalità web")
-                    necessary_syscalls.add(syscall)
-            else:
-                log(f"La syscall {syscall} è necessaria per l’avvio del container")
-                necessary_syscalls.add(syscall)
-                
-        except Exception as e:
-            log(f"Errore durante test della syscall {syscall}: {e}")
-            necessary_syscalls.add(syscall)
-        finally:
-            # Ferma container e rimuovi file di test
-            stop_container()
-            try:
-                os.remove(test_profile_path)
-            except:
-                pass
+            observed = trace_syscalls(default_profile, set(candidates))
+            if observed is None or not observed & set(candidates):
+                log("Il profilo tracciato non basta, si procede per bisezione")
+                break
+            necessary_syscalls.update(observed & set(candidates))
+            candidates = [syscall for syscall in candidates if syscall not in observed]
+    
+    # Bisezione sulle syscall rimaste, con un container per porta in parallelo
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        ddmin(default_profile, index, candidates, removed_syscalls, necessary_syscalls, cache, executor)
+    log(f"Eseguiti {len(cache)} test del container")
     
     # Pulizia finale
-    stop_container()
+    stop_test_containers()
     
     # Salva profilo minimizzato
+    working_profile = remove_syscalls_from_profile(default_profile, removed_syscalls, index)
+    save_seccomp_profile(working_profile, working_profile_path)
     save_seccomp_profile(working_profile, "seccomp-minimized.json")
+    # Se nessun test è passato il profilo non è mai stato verificato (es. apparmor
+    # non caricato o porta occupata): non va riusato nelle esecuzioni successive
+    if removed_syscalls:
+        save_run_cache(run_key, necessary_syscalls, working_profile)
+    else:
+        log("Nessun profilo ridotto ha funzionato: controlla l'ambiente, risultato non salvato in cache")
     
     # Report risultati
     log("=== MINIMIZZAZIONE COMPLETATA ===")
@@ -299,9 +771,9 @@ if __name__ == "__main__":
         minimize_seccomp_profile()
     except KeyboardInterrupt:
         log("Minimizzazione interrotta dall’utente")
-        stop_container()
+        stop_test_containers()
         sys.exit(1)
     except Exception as e:
         log(f"Minimizzazione fallita con errore: {e}")
-        stop_container()
+        stop_test_containers()
         sys.exit(1)